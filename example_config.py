@@ -5,6 +5,8 @@ from datetime import timedelta
 RESTFULGIT_REPO_BASE_PATH = '/Code/'
 # default number of commits that should be returned by /repos/<repo_key>/git/commits/
 RESTFULGIT_DEFAULT_COMMIT_LIST_LIMIT = 50
+# how long the list of repositories found under the base path is reused before rescanning it (None disables caching)
+RESTFULGIT_REPO_LIST_CACHE_TIMEOUT = timedelta(seconds=10)
 
 # Cross-Origin Resource Sharing
 RESTFULGIT_ENABLE_CORS = False
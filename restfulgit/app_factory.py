@@ -18,6 +18,7 @@ BLUEPRINTS = (plumbing, porcelain, archives)
 
 class DefaultConfig(object):
     RESTFULGIT_DEFAULT_COMMIT_LIST_LIMIT = 50
+    RESTFULGIT_REPO_LIST_CACHE_TIMEOUT = timedelta(seconds=10)
     RESTFULGIT_ENABLE_CORS = False
     RESTFULGIT_CORS_ALLOWED_HEADERS = []
     RESTFULGIT_CORS_ALLOW_CREDENTIALS = False
@@ -4,12 +4,13 @@
 import tarfile
 import zipfile
 import os
-from datetime import datetime
 from tempfile import mkstemp as _make_temp_file_handle
 from io import BytesIO
+from queue import Queue, Full
+from threading import Thread, Event
 
 from flask import current_app, Blueprint, send_file
-from pygit2 import GIT_OBJ_BLOB, GIT_OBJ_TREE
+from pygit2 import Repository, GIT_OBJ_BLOB, GIT_OBJ_TREE
 
 from restfulgit.plumbing.retrieval import get_repo, get_tree
 from restfulgit.plumbing.converters import GIT_MODE_SUBMODULE
@@ -20,17 +21,22 @@ from restfulgit.utils.cors import corsify
 from restfulgit.utils import mime_types
 
 
+# Archives are generated from scratch on every request, so favor compression speed over compression ratio
+COMPRESSION_LEVEL = 1
+
 # Detect whether we can actually use compression for archive files
 try:
     import zlib
 except ImportError:
     ZLIB_SUPPORT = False
     TARFILE_WRITE_MODE = 'w'
+    TARFILE_COMPRESSION_KWARGS = {}
     ZIP_COMPRESSION_METHOD = zipfile.ZIP_STORED
 else:
     del zlib
     ZLIB_SUPPORT = True
     TARFILE_WRITE_MODE = 'w:gz'
+    TARFILE_COMPRESSION_KWARGS = {'compresslevel': COMPRESSION_LEVEL}
     ZIP_COMPRESSION_METHOD = zipfile.ZIP_DEFLATED
 
 
@@ -38,7 +44,8 @@ ZIP_EXTENSION = '.zip'
 TAR_EXTENSION = '.tar'
 TGZ_EXTENSION = '.tar.gz'
 
-EPOCH_START = datetime(1970, 1, 1)
+PREFETCH_QUEUE_SIZE = 16  # git objects
+PREFETCH_PUT_TIMEOUT = 0.1  # seconds
 
 
 archives = Blueprint('archives', __name__)  # pylint: disable=C0103
@@ -61,6 +68,66 @@ def _walk_tree_recursively(repo, tree, blobs_only=False, base_path=''):
                 yield subpath, subfilemode, subobj
 
 
+def _archive_entries(repo_path, tree_id, blobs_only=False):
+    """
+    Yields a (path, filemode, object type, blob data or None) tuple for each object under the given tree.
+    Meant to be consumed by _prefetched()'s background thread, so it opens its own Repository instead of sharing
+    the request's across threads, and only hands plain Python values back to the request thread.
+    """
+    repo = Repository(repo_path)
+    for path, filemode, obj in _walk_tree_recursively(repo, repo[tree_id], blobs_only):
+        yield path, filemode, obj.type, (obj.data if obj.type == GIT_OBJ_BLOB else None)
+
+
+class _PrefetchFailure(object):
+    def __init__(self, error):
+        self.error = error
+
+
+_PREFETCH_DONE = object()
+
+
+def _prefetched(items, max_prefetch=PREFETCH_QUEUE_SIZE):
+    """
+    Consumes the given iterable in a background thread, staying at most `max_prefetch` items ahead of the caller.
+    Lets libgit2 inflate the next objects while the caller is busy compressing (zlib releases the GIL while it works).
+    Exceptions raised by the iterable are re-raised in the caller.
+    """
+    buffer = Queue(maxsize=max_prefetch)
+    abandoned = Event()
+
+    def put(entry):
+        while not abandoned.is_set():
+            try:
+                buffer.put(entry, timeout=PREFETCH_PUT_TIMEOUT)
+            except Full:
+                continue
+            return True
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except Exception as err:  # pylint: disable=W0703
+            put(_PrefetchFailure(err))
+        else:
+            put(_PREFETCH_DONE)
+
+    Thread(target=produce, name='restfulgit-archive-prefetch', daemon=True).start()
+    try:
+        while True:
+            entry = buffer.get()
+            if entry is _PREFETCH_DONE:
+                return
+            if isinstance(entry, _PrefetchFailure):
+                raise entry.error
+            yield entry
+    finally:
+        abandoned.set()  # lets the producer thread exit even if we stopped consuming early
+
+
 def _wrapper_dir_name_for(repo_key, commit):
     return "{}-{}".format(repo_key, str(commit.id))
 
@@ -108,10 +175,10 @@ def get_zip_file(repo_key, branch_or_tag_or_sha):
 
     wrapper_dir = _wrapper_dir_name_for(repo_key, commit)
     temp_file = _make_temp_file(suffix=ZIP_EXTENSION)
-    with zipfile.ZipFile(temp_file, mode='w', compression=ZIP_COMPRESSION_METHOD, allowZip64=True) as zip_file:
-        for filepath, _, blob in _walk_tree_recursively(repo, tree, blobs_only=True):
-            filepath = os.path.join(wrapper_dir, filepath)
-            zip_file.writestr(filepath, blob.data)
+    with zipfile.ZipFile(temp_file, mode='w', compression=ZIP_COMPRESSION_METHOD, compresslevel=COMPRESSION_LEVEL, allowZip64=True) as zip_file:
+        for filepath, _, _, data in _prefetched(_archive_entries(repo.path, tree.id, blobs_only=True)):
+            # passing a name rather than a ZipInfo lets the ZipFile apply its own compression method & level
+            zip_file.writestr(os.path.join(wrapper_dir, filepath), data)
     temp_file.seek(0)
     return _send_transient_file_as_attachment(temp_file,
                                               _archive_filename_for(repo_key, refspec=branch_or_tag_or_sha, ext=ZIP_EXTENSION),
@@ -134,27 +201,23 @@ def get_tarball(repo_key, branch_or_tag_or_sha):
 
     wrapper_dir = _wrapper_dir_name_for(repo_key, commit)
     extension = (TGZ_EXTENSION if ZLIB_SUPPORT else TAR_EXTENSION)
-    timestamp = int((datetime.utcnow() - EPOCH_START).total_seconds())  # FIX ME: use committer/author timestamp?
+    timestamp = commit.committer.time  # same as `git archive`
     temp_file = _make_temp_file(suffix=extension)
-    with tarfile.open(fileobj=temp_file, mode=TARFILE_WRITE_MODE, encoding='utf-8') as tar_file:
+    with tarfile.open(fileobj=temp_file, mode=TARFILE_WRITE_MODE, encoding='utf-8', **TARFILE_COMPRESSION_KWARGS) as tar_file:
         tar_file.pax_headers = {'comment': str(commit.id)}
 
-        for path, filemode, obj in _walk_tree_recursively(repo, tree):
+        for path, filemode, obj_type, data in _prefetched(_archive_entries(repo.path, tree.id)):
             tar_info = tarfile.TarInfo(os.path.join(wrapper_dir, path))
             tar_info.mtime = timestamp
 
-            if obj.type == GIT_OBJ_BLOB:
-                tar_info.size = obj.size
-
-            if obj.type == GIT_OBJ_TREE:
-                filemode = 0o755  # git doesn't store meaningful directory perms
-            tar_info.mode = filemode
-
-            if obj.type == GIT_OBJ_BLOB:
+            if obj_type == GIT_OBJ_BLOB:
                 tar_info.type = tarfile.REGTYPE
-                content = BytesIO(obj.data)
-            elif obj.type == GIT_OBJ_TREE:
+                tar_info.mode = filemode
+                tar_info.size = len(data)
+                content = BytesIO(data)  # shares the immutable bytes buffer; no copy is made unless written to
+            elif obj_type == GIT_OBJ_TREE:
                 tar_info.type = tarfile.DIRTYPE
+                tar_info.mode = 0o755  # git doesn't store meaningful directory perms
                 content = None
             # FIX ME: handle submodules & symlinks
 
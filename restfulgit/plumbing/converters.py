@@ -3,14 +3,17 @@
 
 from base64 import b64encode
 from datetime import datetime
+from operator import itemgetter
 
 from flask import url_for
 from pygit2 import GIT_OBJ_COMMIT, GIT_OBJ_BLOB, GIT_OBJ_TREE, GIT_OBJ_TAG
 
-from restfulgit.utils.timezones import FixedOffset
+from restfulgit.utils.timezones import UTC
+from restfulgit.utils.url_builders import url_builder_for
 
 
 GIT_MODE_SUBMODULE = 0o0160000
+BINARY_DETECTION_PREFIX_LEN = 8000  # bytes; same as git's buffer_is_binary()
 GIT_OBJ_TYPE_TO_NAME = {
     GIT_OBJ_COMMIT: 'commit',
     GIT_OBJ_TREE: 'tree',
@@ -23,52 +26,55 @@ def _convert_signature(sig):
     return {
         "name": sig.name,
         "email": sig.email,
-        "date": datetime.fromtimestamp(sig.time, FixedOffset(sig.offset))
+        "date": datetime.fromtimestamp(sig.time, UTC),  # the API reports all dates in UTC
     }
 
 
 def convert_commit(repo_key, commit, porcelain=False):
+    plumbing_commit_url_for = url_builder_for('plumbing.get_commit', 'sha', repo_key=repo_key)
     if porcelain:
-        def commit_url_for(sha):
-            return url_for('porcelain.get_commit', _external=True,
-                           repo_key=repo_key, branch_or_tag_or_sha=sha)
+        commit_url_for = url_builder_for('porcelain.get_commit', 'branch_or_tag_or_sha', repo_key=repo_key)
     else:
-        def commit_url_for(sha):
-            return url_for('plumbing.get_commit', _external=True,
-                           repo_key=repo_key, sha=sha)
+        commit_url_for = plumbing_commit_url_for
+    tree_url_for = url_builder_for('plumbing.get_tree', 'sha', repo_key=repo_key)
 
+    sha = str(commit.id)
+    tree_sha = str(commit.tree_id)
+    parent_shas = [str(parent_id) for parent_id in commit.parent_ids]
     return {
-        "url": url_for('plumbing.get_commit', _external=True,
-                       repo_key=repo_key, sha=str(commit.id)),
-        "sha": str(commit.id),
+        "url": plumbing_commit_url_for(sha),
+        "sha": sha,
         "author": _convert_signature(commit.author),
         "committer": _convert_signature(commit.committer),
         "message": commit.message.rstrip(),
         "tree": {
-            "sha": str(commit.tree_id),
-            "url": url_for('plumbing.get_tree', _external=True,
-                           repo_key=repo_key, sha=str(commit.tree_id)),
+            "sha": tree_sha,
+            "url": tree_url_for(tree_sha),
         },
         "parents": [{
-            "sha": str(c.id),
-            "url": commit_url_for(str(c.id)),
-        } for c in commit.parents]
+            "sha": parent_sha,
+            "url": commit_url_for(parent_sha),
+        } for parent_sha in parent_shas]
     }
 
 
 def encode_blob_data(data):
-    try:
-        return 'utf-8', data.decode('utf-8')
-    except UnicodeDecodeError:
-        return 'base64', b64encode(data).decode()
+    # Like git, treat content with a NUL byte near its start as binary without attempting to decode it
+    if b'\x00' not in data[:BINARY_DETECTION_PREFIX_LEN]:
+        try:
+            return 'utf-8', data.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return 'base64', b64encode(data).decode('ascii')
 
 
 def convert_blob(repo_key, blob):
     encoding, data = encode_blob_data(blob.data)
+    sha = str(blob.id)
     return {
         "url": url_for('plumbing.get_blob', _external=True,
-                       repo_key=repo_key, sha=str(blob.id)),
-        "sha": str(blob.id),
+                       repo_key=repo_key, sha=sha),
+        "sha": sha,
         "size": blob.size,
         "encoding": encoding,
         "content": data,
@@ -79,56 +85,62 @@ def _tree_entries(repo_key, repo, tree, recursive=False, path=''):
     entry_list = []
     for entry in tree:
         entry_name = entry.name
+        sha = str(entry.id)
         if entry.filemode == GIT_MODE_SUBMODULE:
             entry_data = {
                 "path": entry_name,
-                "sha": str(entry.id),
+                "sha": sha,
                 "type": "submodule",
             }
         else:
+            entry_path = path + entry_name
             obj = repo[entry.id]
             if obj.type == GIT_OBJ_BLOB:
                 entry_data = {
-                    "path": '%s%s' % (path, entry_name),
-                    "sha": str(entry.id),
+                    "path": entry_path,
+                    "sha": sha,
                     "type": "blob",
                     "size": obj.size,
                     "url": url_for('plumbing.get_blob', _external=True,
-                                   repo_key=repo_key, sha=str(entry.id)),
+                                   repo_key=repo_key, sha=sha),
                 }
             elif obj.type == GIT_OBJ_TREE:
-                if recursive:
-                    entry_list += _tree_entries(repo_key, repo, obj, True, '%s%s/' % (path, entry_name))
                 entry_data = {
-                    "path": '%s%s' % (path, entry_name),
-                    "sha": str(entry.id),
+                    "path": entry_path,
+                    "sha": sha,
                     "type": "tree",
                     "url": url_for('plumbing.get_tree', _external=True,
-                                   repo_key=repo_key, sha=str(entry.id))
+                                   repo_key=repo_key, sha=sha)
                 }
         entry_data['mode'] = oct(entry.filemode)[2:].zfill(6)  # 6 octal digits without single leading base-indicating 0
         entry_list.append(entry_data)
+        if recursive and entry_data['type'] == 'tree':
+            # emit subtree entries after their parent so that the list comes out (nearly) path-sorted
+            entry_list += _tree_entries(repo_key, repo, obj, True, entry_path + '/')
     return entry_list
 
 
 def convert_tree(repo_key, repo, tree, recursive=False):
     entry_list = _tree_entries(repo_key, repo, tree, recursive=recursive)
-    entry_list.sort(key=lambda entry: entry['path'])
+    # git orders a subtree "x" as if it were named "x/", so a final sort is still needed,
+    # but the input is already almost in order, which Timsort handles in roughly linear time.
+    entry_list.sort(key=itemgetter('path'))
+    sha = str(tree.id)
     return {
         "url": url_for('plumbing.get_tree', _external=True,
-                       repo_key=repo_key, sha=str(tree.id)),
-        "sha": str(tree.id),
+                       repo_key=repo_key, sha=sha),
+        "sha": sha,
         "tree": entry_list,
     }
 
 
 def _linkobj_for_gitobj(repo_key, obj, include_type=False):
     data = {}
-    data['sha'] = str(obj.id)
+    data['sha'] = sha = str(obj.id)
     obj_type = GIT_OBJ_TYPE_TO_NAME.get(obj.type)
     if obj_type is not None:
         data['url'] = url_for('plumbing.get_' + obj_type, _external=True,
-                              repo_key=repo_key, sha=str(obj.id))
+                              repo_key=repo_key, sha=sha)
     if include_type:
         data['type'] = obj_type
     return data
@@ -145,17 +157,19 @@ def convert_ref(repo_key, ref, obj):
 
 def convert_tag(repo_key, repo, tag):
     target_type_name = GIT_OBJ_TYPE_TO_NAME.get(repo[tag.target].type)
+    sha = str(tag.id)
+    target_sha = str(tag.target)
     return {
         "url": url_for('plumbing.get_tag', _external=True,
-                       repo_key=repo_key, sha=str(tag.id)),
-        "sha": str(tag.id),
+                       repo_key=repo_key, sha=sha),
+        "sha": sha,
         "tag": tag.name,
         "tagger": _convert_signature(tag.tagger),
         "message": tag.message,
         "object": {
             "type": target_type_name,
-            "sha": str(tag.target),
+            "sha": target_sha,
             "url": url_for('plumbing.get_' + target_type_name, _external=True,
-                           repo_key=repo_key, sha=str(tag.target)),
+                           repo_key=repo_key, sha=target_sha),
         },
     }
@@ -129,13 +129,13 @@ def get_refs(repo_key, ref_path=None):
     else:
         ref_path = ""
     repo = get_repo(repo_key)
-    ref_names = filter(lambda x: x.startswith(ref_path), repo.listall_references())
-    references = (repo.lookup_reference(ref_name) for ref_name in ref_names)
-    nonsymbolic_refs = filter(lambda x: x.type != GIT_REF_SYMBOLIC, references)
-    ref_data = [
-        convert_ref(repo_key, reference, repo[reference.target])
-        for reference in nonsymbolic_refs
-    ]
+    ref_data = []
+    for reference in repo.listall_reference_objects():
+        if not reference.name.startswith(ref_path):
+            continue
+        if reference.type == GIT_REF_SYMBOLIC:
+            continue
+        ref_data.append(convert_ref(repo_key, reference, repo[reference.target]))
     if len(ref_data) == 1 and ref_data[0]['ref'] == ref_path:
         # exact match
         ref_data = ref_data[0]
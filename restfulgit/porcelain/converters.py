@@ -1,13 +1,13 @@
 # coding=utf-8
 
 
-import re
-
 from flask import url_for
 
 from restfulgit.plumbing.retrieval import get_commit
 from restfulgit.plumbing.converters import convert_commit as _plumbing_convert_commit
 from restfulgit.porcelain.retrieval import get_repo_description, get_diff
+from restfulgit.utils.url_builders import url_builder_for
+from restfulgit.utils.url_converters import repo_key_to_url
 
 
 GIT_STATUS_TO_NAME = {
@@ -16,7 +16,18 @@ GIT_STATUS_TO_NAME = {
     'R': 'renamed',
     'D': 'removed',
 }
-SPLIT_PATCH_TXT_RE = re.compile(r'^\+\+\+\ b\/([^\n]*?)\n(@@.*?)(?=\n^diff|\n\Z)', re.M | re.S)
+# Markers for splitting a multi-file patch into per-file hunks
+FILE_PATCH_SEPARATOR = '\ndiff '
+NEW_FILENAME_LINE_PREFIX = '\n+++ b/'
+HUNK_HEADER_PREFIX = '@@'
+
+
+def _repo_url_for(endpoint, repo_key, **values):
+    return url_builder_for(endpoint, 'repo_key', **values)(repo_key_to_url(repo_key))
+
+
+def _repo_url_template_for(endpoint, repo_key, template_suffix, **values):
+    return _repo_url_for(endpoint, repo_key, **values).rstrip('/') + template_suffix
 
 
 def convert_repo(repo_key):
@@ -25,24 +36,25 @@ def convert_repo(repo_key):
         "name": repo_key,
         "full_name": repo_key,
         "description": description,
-        "url": url_for('porcelain.get_repo_info', _external=True, repo_key=repo_key),
-        "branches_url": (url_for('porcelain.get_branches', _external=True, repo_key=repo_key).rstrip('/') + '{/branch}'),
-        "blobs_url": (url_for('plumbing.get_blob', _external=True, repo_key=repo_key, sha='').rstrip('/') + '{/sha}'),
-        "commits_url": (url_for('porcelain.get_commit', _external=True, repo_key=repo_key, branch_or_tag_or_sha='').rstrip('/') + '{/sha}'),
-        "git_commits_url": (url_for('plumbing.get_commit', _external=True, repo_key=repo_key, sha='').rstrip('/') + '{/sha}'),
-        "git_refs_url": (url_for('plumbing.get_refs', _external=True, repo_key=repo_key).rstrip('/') + '{/sha}'),
-        "git_tags_url": (url_for('plumbing.get_tag', _external=True, repo_key=repo_key, sha='').rstrip('/') + '{/sha}'),
-        "tags_url": url_for('porcelain.get_tags', _external=True, repo_key=repo_key),
-        "trees_url": (url_for('plumbing.get_tree', _external=True, repo_key=repo_key, sha='').rstrip('/') + '{/sha}'),
+        "url": _repo_url_for('porcelain.get_repo_info', repo_key),
+        "branches_url": _repo_url_template_for('porcelain.get_branches', repo_key, '{/branch}'),
+        "blobs_url": _repo_url_template_for('plumbing.get_blob', repo_key, '{/sha}', sha=''),
+        "commits_url": _repo_url_template_for('porcelain.get_commit', repo_key, '{/sha}', branch_or_tag_or_sha=''),
+        "git_commits_url": _repo_url_template_for('plumbing.get_commit', repo_key, '{/sha}', sha=''),
+        "git_refs_url": _repo_url_template_for('plumbing.get_refs', repo_key, '{/sha}'),
+        "git_tags_url": _repo_url_template_for('plumbing.get_tag', repo_key, '{/sha}', sha=''),
+        "tags_url": _repo_url_for('porcelain.get_tags', repo_key),
+        "trees_url": _repo_url_template_for('plumbing.get_tree', repo_key, '{/sha}', sha=''),
     }
 
 
 def convert_branch_summary(repo_key, branch):
-    url = url_for('porcelain.get_commit', _external=True, repo_key=repo_key, branch_or_tag_or_sha=str(branch.target))
+    sha = str(branch.target)
+    url = url_builder_for('porcelain.get_commit', 'branch_or_tag_or_sha', repo_key=repo_key)(sha)
     return {
-        "name": branch.branch_name,
+        "name": branch.shorthand,  # same as Branch.branch_name, but also works for plain References
         "commit": {
-            "sha": str(branch.target),
+            "sha": sha,
             "url": url,
         }
     }
@@ -63,36 +75,61 @@ def convert_branch_verbose(repo_key, repo, branch):
 
 
 def _filename_to_patch_from(diff):
-    if diff.patch is None:
+    patch_text = diff.patch
+    if not patch_text:
         return {}
-    matches = re.findall(SPLIT_PATCH_TXT_RE, diff.patch)
-    return dict(m for m in matches)
+    filename_to_patch = {}
+    file_patches = patch_text.split(FILE_PATCH_SEPARATOR)
+    last_index = len(file_patches) - 1
+    for index, file_patch in enumerate(file_patches):
+        # extract the "b/" filename and the hunks that follow it, if any
+        filename_start = file_patch.find(NEW_FILENAME_LINE_PREFIX)
+        if filename_start < 0:
+            continue  # e.g. binary files, deletions, mode-only changes
+        filename_start += len(NEW_FILENAME_LINE_PREFIX)
+        filename_end = file_patch.find('\n', filename_start)
+        if filename_end < 0 or not file_patch.startswith(HUNK_HEADER_PREFIX, filename_end + 1):
+            continue
+        hunks = file_patch[(filename_end + 1):]
+        if index == last_index:
+            if not hunks.endswith('\n'):
+                continue
+            hunks = hunks[:-1]
+        filename_to_patch[file_patch[filename_start:filename_end]] = hunks
+    return filename_to_patch
 
 
 def _convert_patch(repo_key, commit, patch, filename_to_patch):
-    deleted = patch.delta.status_char() == 'D'
+    delta = patch.delta
+    new_file = delta.new_file
+    old_file = delta.old_file
+    new_path = new_file.path
+    status_char = delta.status_char()
+    deleted = status_char == 'D'
     commit_sha = str(commit.id if not deleted else commit.parent_ids[0])
+    _, additions, deletions = patch.line_stats
     result = {
-        "sha": str(patch.delta.new_file.id if not deleted else patch.delta.old_file.id),
-        "status": GIT_STATUS_TO_NAME[patch.delta.status_char()],
-        "filename": patch.delta.new_file.path,
-        "old_filename": patch.delta.old_file.path,  # NOTE: RestfulGit extension
-        "additions": patch.line_stats[1],
-        "deletions": patch.line_stats[2],
-        "changes": patch.line_stats[1] + patch.line_stats[2],
+        "sha": str(new_file.id if not deleted else old_file.id),
+        "status": GIT_STATUS_TO_NAME[status_char],
+        "filename": new_path,
+        "old_filename": old_file.path,  # NOTE: RestfulGit extension
+        "additions": additions,
+        "deletions": deletions,
+        "changes": additions + deletions,
         "raw_url": url_for('porcelain.get_raw',
                            _external=True,
                            repo_key=repo_key,
                            branch_or_tag_or_sha=commit_sha,
-                           file_path=patch.delta.new_file.path),
+                           file_path=new_path),
         "contents_url": url_for('porcelain.get_contents',
                                 _external=True,
                                 repo_key=repo_key,
-                                file_path=patch.delta.new_file.path,
+                                file_path=new_path,
                                 ref=commit_sha),
     }
-    if patch.delta.new_file.path in filename_to_patch:
-        result['patch'] = filename_to_patch[patch.delta.new_file.path]
+    file_patch = filename_to_patch.get(new_path)
+    if file_patch is not None:
+        result['patch'] = file_patch
     return result
 
 
@@ -103,40 +140,44 @@ def convert_commit(repo_key, repo, commit, include_diff=False):
         "sha": plain_commit_json['sha'],
         "author": plain_commit_json['author'],
         "committer": plain_commit_json['committer'],
-        "url": url_for('porcelain.get_commit', _external=True,
-                       repo_key=repo_key, branch_or_tag_or_sha=str(commit.id)),
-        "parents": [{
-            "sha": str(c.id),
-            "url": url_for('porcelain.get_commit', _external=True,
-                           repo_key=repo_key, branch_or_tag_or_sha=str(c.id))
-        } for c in commit.parents],
+        "url": url_builder_for('porcelain.get_commit', 'branch_or_tag_or_sha', repo_key=repo_key)(plain_commit_json['sha']),
+        "parents": plain_commit_json['parents'],  # already use porcelain URLs
     }
     if include_diff:
         diff = get_diff(repo, commit)
-        patches = list(diff)
         filename_to_patch = _filename_to_patch_from(diff)
-        patches_additions = sum(patch.line_stats[1] for patch in patches)
-        patches_deletions = sum(patch.line_stats[2] for patch in patches)
+        files = []
+        patches_additions = patches_deletions = 0
+        for patch in diff:
+            file_json = _convert_patch(repo_key, commit, patch, filename_to_patch)
+            patches_additions += file_json['additions']
+            patches_deletions += file_json['deletions']
+            files.append(file_json)
         result.update({
             "stats": {
                 "additions": patches_additions,
                 "deletions": patches_deletions,
                 "total": patches_additions + patches_deletions,
             },
-            "files": [_convert_patch(repo_key, commit, patch, filename_to_patch) for patch in patches],
+            "files": files,
         })
     return result
 
 
 def convert_blame(repo_key, repo, blame, raw_lines, start_line):
     annotated_lines = []
-    commit_shas = set()
+    commits = {}
+    shas = {}  # commit Oid => SHA string; shared by every line blamed on that commit
+    for_line = blame.for_line
     for line_num, line in enumerate(raw_lines, start=start_line):
-        hunk = blame.for_line(line_num)
-        commit_sha = hunk.final_commit_id
-        commit_shas.add(commit_sha)
+        hunk = for_line(line_num)
+        commit_id = hunk.final_commit_id
+        commit_sha = shas.get(commit_id)
+        if commit_sha is None:
+            commit_sha = shas[commit_id] = str(commit_id)
+            commits[commit_sha] = _plumbing_convert_commit(repo_key, get_commit(repo, commit_id))
         annotated_lines.append({
-            'commit': str(commit_sha),
+            'commit': commit_sha,
             'origPath': hunk.orig_path,
             'lineNum': line_num,
             'line': line.decode(),
@@ -144,8 +185,5 @@ def convert_blame(repo_key, repo, blame, raw_lines, start_line):
 
     return {
         'lines': annotated_lines,
-        'commits': {
-            str(commit_sha): _plumbing_convert_commit(repo_key, get_commit(repo, commit_sha))
-            for commit_sha in commit_shas
-        }
+        'commits': commits,
     }
@@ -2,14 +2,21 @@
 
 
 import os
+import stat
+import time
+from functools import lru_cache
+from operator import itemgetter
 
 from flask import current_app, url_for, safe_join
 from werkzeug.exceptions import NotFound, BadRequest
-from pygit2 import GIT_OBJ_COMMIT, GIT_OBJ_BLOB, GIT_OBJ_TREE, GIT_OBJ_TAG, GIT_REF_SYMBOLIC, GIT_BLAME_TRACK_COPIES_SAME_COMMIT_MOVES, GIT_BLAME_TRACK_COPIES_SAME_COMMIT_COPIES, GIT_SORT_NONE, GitError
+from pygit2 import Oid, GIT_FILEMODE_TREE, GIT_OBJ_COMMIT, GIT_OBJ_BLOB, GIT_OBJ_TREE, GIT_OBJ_TAG, GIT_REF_SYMBOLIC, GIT_BLAME_TRACK_COPIES_SAME_COMMIT_MOVES, GIT_BLAME_TRACK_COPIES_SAME_COMMIT_COPIES, GIT_SORT_NONE, GitError
 from restfulgit.plumbing.converters import GIT_OBJ_TYPE_TO_NAME, encode_blob_data
+from restfulgit.utils.url_builders import url_builder_for
 
 
 DEFAULT_GIT_DESCRIPTION = "Unnamed repository; edit this file 'description' to name the repository.\n"
+DESCRIPTION_CACHE_SIZE = 1024  # description files
+FULL_SHA_LEN = 40  # hex digits
 GIT_OBJ_TO_PORCELAIN_NAME = {
     GIT_OBJ_TREE: 'dir',
     GIT_OBJ_BLOB: 'file',
@@ -30,17 +37,45 @@ def detect_repos(path, depth=5):
             yield from detect_repos(dirent.path, depth=depth-1)
 
 
-def get_repo_names():
-    prefix = current_app.config['RESTFULGIT_REPO_BASE_PATH'].rstrip('/') + '/'
+def _detect_repo_names(base_path):
+    prefix = base_path.rstrip('/') + '/'
     prefix_len = len(prefix)
-    relative_repo_paths = (path[prefix_len:] for path in detect_repos(prefix)
-                           if path.startswith(prefix))
-    return {rel_path for rel_path in relative_repo_paths}
+    # detect_repos() visits each directory only once, so no de-duplication is needed
+    return tuple(sorted(path[prefix_len:] for path in detect_repos(prefix) if path.startswith(prefix)))
+
+
+_REPO_NAMES_CACHE = {}  # base path => (expiry time, repo names)
+
+
+def get_repo_names():
+    base_path = current_app.config['RESTFULGIT_REPO_BASE_PATH']
+    now = time.monotonic()
+    cached = _REPO_NAMES_CACHE.get(base_path)
+    if cached is not None and now < cached[0]:
+        return cached[1]
+    repo_names = _detect_repo_names(base_path)
+    cache_timeout = current_app.config['RESTFULGIT_REPO_LIST_CACHE_TIMEOUT']
+    if cache_timeout:
+        _REPO_NAMES_CACHE[base_path] = (now + cache_timeout.total_seconds(), repo_names)
+    return repo_names
+
+
+def _lookup_full_sha(repo, refspec):
+    """Returns the object named by a full hex SHA without going through revparse, or None."""
+    if len(refspec) != FULL_SHA_LEN:
+        return None
+    try:
+        oid = Oid(hex=refspec)
+    except ValueError:
+        return None
+    return repo.get(oid)
 
 
 def get_commit_for_refspec(repo, branch_or_tag_or_sha):
     try:
-        commit = repo.revparse_single(branch_or_tag_or_sha)
+        commit = _lookup_full_sha(repo, branch_or_tag_or_sha)
+        if commit is None:
+            commit = repo.revparse_single(branch_or_tag_or_sha)
         if commit.type == GIT_OBJ_TAG:
             commit = commit.peel(GIT_OBJ_COMMIT)
         return commit
@@ -56,19 +91,33 @@ def get_branch(repo, branch_name):
 
 
 def get_object_from_path(repo, tree, path):
-    path_segments = path.split("/")
-
-    ctree = tree
-    for i, path_seg in enumerate(path_segments):
-        if ctree.type != GIT_OBJ_TREE:
+    if not path:
+        return tree
+    trailing_slash = path.endswith('/')  # allowed in paths to directories
+    if trailing_slash:
+        path = path[:-1]
+
+    obj = tree
+    for path_seg in path.split('/'):
+        if obj.type != GIT_OBJ_TREE:
             raise NotFound("invalid path; traversal unexpectedly encountered a non-tree")
-        if not path_seg and i == len(path_segments) - 1:  # allow trailing slash in paths to directories
-            continue
         try:
-            ctree = repo[ctree[path_seg].id]
+            obj = repo[obj[path_seg].id]
         except KeyError:
             raise NotFound("invalid path; no such object")
-    return ctree
+    if trailing_slash and obj.type != GIT_OBJ_TREE:
+        raise NotFound("invalid path; traversal unexpectedly encountered a non-tree")
+    return obj
+
+
+@lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)
+def _read_repo_description(filepath, mtime_ns, size):  # pylint: disable=W0613
+    # The file's modification time and size are part of the cache key, so edits to the file invalidate its entry
+    with open(filepath, 'r') as content_file:
+        description = content_file.read()
+    if description == DEFAULT_GIT_DESCRIPTION:
+        description = None
+    return description
 
 
 def get_repo_description(repo_key):
@@ -76,26 +125,49 @@ def get_repo_description(repo_key):
         os.path.join(repo_key, 'description'),
         os.path.join(repo_key, '.git', 'description'),
     )
-    extant_relative_paths = (
-        relative_path
-        for relative_path in relative_paths
-        if os.path.isfile(safe_join(current_app.config['RESTFULGIT_REPO_BASE_PATH'], relative_path))
-    )
-    extant_relative_path = next(extant_relative_paths, None)
-    if extant_relative_path is None:
-        return None
-    with open(os.path.join(current_app.config['RESTFULGIT_REPO_BASE_PATH'], extant_relative_path), 'r') as content_file:
-        description = content_file.read()
-        if description == DEFAULT_GIT_DESCRIPTION:
-            description = None
-        return description
+    for relative_path in relative_paths:
+        filepath = safe_join(current_app.config['RESTFULGIT_REPO_BASE_PATH'], relative_path)
+        try:
+            file_stat = os.stat(filepath)
+        except OSError:
+            continue
+        if stat.S_ISREG(file_stat.st_mode):
+            return _read_repo_description(filepath, file_stat.st_mtime_ns, file_stat.st_size)
+    return None
 
 
-def get_raw_file_content(repo, tree, path):
+def get_raw_file_blob(repo, tree, path):
     git_obj = get_object_from_path(repo, tree, path)
     if git_obj.type != GIT_OBJ_BLOB:
         raise BadRequest("path resolved to non-blob object")
-    return git_obj.data
+    return git_obj
+
+
+def get_raw_file_content(repo, tree, path):
+    return get_raw_file_blob(repo, tree, path).data
+
+
+def split_line_range(data, first_line, last_line=None):
+    """
+    Returns the lines from `first_line` through `last_line` (1-based, inclusive; None means through the end)
+    of the given bytes, split the same way as bytes.splitlines(), along with the total number of lines.
+    Lines after `last_line` are counted but never split out into separate objects.
+    """
+    if b'\r' in data:  # splitlines() also splits on bare CRs, so just defer to it
+        lines = data.splitlines()
+        return lines[(first_line - 1):last_line], len(lines)
+    ends_with_newline = data.endswith(b'\n')
+    line_count = data.count(b'\n')
+    if data and not ends_with_newline:
+        line_count += 1
+    if last_line is not None and last_line < line_count:
+        lines = data.split(b'\n', last_line)
+        lines.pop()  # the unsplit remainder of the data
+    else:
+        lines = data.split(b'\n')
+        if ends_with_newline or not data:
+            lines.pop()  # splitlines() doesn't produce an empty final line
+    return lines[(first_line - 1):], line_count
 
 
 def get_diff(repo, commit, against=None, context_lines=3):
@@ -142,26 +214,15 @@ def get_authors(repo):
         return (commit.author for commit in repo.walk(target, GIT_SORT_NONE))  # pylint: disable=E1103
 
 
-# FIX ME: should be in different module?
-def get_contents(repo_key, repo, refspec, file_path, obj, _recursing=False):
-    # FIX ME: implement symlink and submodule cases
-    if not _recursing and obj.type == GIT_OBJ_TREE:
-        entries = [
-            get_contents(repo_key, repo, refspec, os.path.join(file_path, entry.name), repo[entry.id], _recursing=True)
-            for entry in obj
-        ]
-        entries.sort(key=lambda entry: entry["name"])
-        return entries
-
+def _contents_entry(repo_key, refspec, file_path, obj_type, sha, size):  # pylint: disable=R0913
     contents_url = url_for('porcelain.get_contents', _external=True, repo_key=repo_key, file_path=file_path, ref=refspec)
-    git_url = url_for('plumbing.get_' + GIT_OBJ_TYPE_TO_NAME[obj.type], _external=True, repo_key=repo_key, sha=str(obj.id))
-
-    result = {
-        "type": GIT_OBJ_TO_PORCELAIN_NAME[obj.type],
-        "sha": str(obj.id),
+    git_url = url_builder_for('plumbing.get_' + GIT_OBJ_TYPE_TO_NAME[obj_type], 'sha', repo_key=repo_key)(sha)
+    return {
+        "type": GIT_OBJ_TO_PORCELAIN_NAME[obj_type],
+        "sha": sha,
         "name": os.path.basename(file_path),
         "path": file_path,
-        "size": (obj.size if obj.type == GIT_OBJ_BLOB else 0),
+        "size": size,
         "url": contents_url,
         "git_url": git_url,
         "_links": {
@@ -169,7 +230,28 @@ def get_contents(repo_key, repo, refspec, file_path, obj, _recursing=False):
             "git": git_url,
         }
     }
-    if not _recursing and obj.type == GIT_OBJ_BLOB:
+
+
+# FIX ME: should be in different module?
+def get_contents(repo_key, repo, refspec, file_path, obj):
+    # FIX ME: implement symlink and submodule cases
+    if obj.type == GIT_OBJ_TREE:
+        entries = []
+        for entry in obj:
+            entry_path = os.path.join(file_path, entry.name)
+            if entry.filemode == GIT_FILEMODE_TREE:
+                # Subdirectories are listed with size 0, so there's no need to load them from the object database
+                entries.append(_contents_entry(repo_key, refspec, entry_path, GIT_OBJ_TREE, str(entry.id), 0))
+            else:
+                child = repo[entry.id]
+                size = (child.size if child.type == GIT_OBJ_BLOB else 0)
+                entries.append(_contents_entry(repo_key, refspec, entry_path, child.type, str(child.id), size))
+        entries.sort(key=itemgetter('name'))
+        return entries
+
+    size = (obj.size if obj.type == GIT_OBJ_BLOB else 0)
+    result = _contents_entry(repo_key, refspec, file_path, obj.type, str(obj.id), size)
+    if obj.type == GIT_OBJ_BLOB:
         encoding, data = encode_blob_data(obj.data)
         result["encoding"] = encoding
         result["content"] = data
@@ -185,13 +267,10 @@ def _get_common_ancestor_or_none(repo, left_oid, right_oid):
 
 
 def _get_other_nonsymbolic_refs(repo, main_ref_name):
-    for ref_name in repo.listall_references():
-        if ref_name == main_ref_name:
-            continue
-        ref = repo.lookup_reference(ref_name)
-        if ref.type == GIT_REF_SYMBOLIC:
-            continue
-        yield ref
+    return (
+        ref for ref in repo.listall_reference_objects()
+        if ref.name != main_ref_name and ref.type != GIT_REF_SYMBOLIC
+    )
 
 
 def get_commits_unique_to_branch(repo, branch, sort=GIT_SORT_NONE):
@@ -3,31 +3,51 @@
 
 import os
 
-from collections import defaultdict
+from collections import Counter
 
 from flask import request, Response, Blueprint, url_for
 from werkzeug.exceptions import NotFound, BadRequest
-from pygit2 import GIT_SORT_TOPOLOGICAL, GIT_SORT_TIME, GIT_SORT_REVERSE
+from pygit2 import GIT_SORT_TOPOLOGICAL, GIT_SORT_TIME, GIT_SORT_REVERSE, GIT_REF_SYMBOLIC
 
-from restfulgit.plumbing.retrieval import get_repo, lookup_ref, get_tree
+from restfulgit.plumbing.retrieval import get_repo, get_tree
 from restfulgit.plumbing.converters import convert_tag
-from restfulgit.porcelain.retrieval import get_repo_names, get_commit_for_refspec, get_branch as _get_branch, get_object_from_path, get_raw_file_content, get_contents as _get_contents, get_diff as _get_diff, get_blame as _get_blame, get_commits_unique_to_branch as _get_commits_unique_to_branch, get_authors
+from restfulgit.porcelain.retrieval import get_repo_names, get_commit_for_refspec, get_branch as _get_branch, get_object_from_path, get_raw_file_blob, get_raw_file_content, split_line_range, get_contents as _get_contents, get_diff as _get_diff, get_blame as _get_blame, get_commits_unique_to_branch as _get_commits_unique_to_branch, get_authors
 from restfulgit.porcelain.converters import convert_repo, convert_branch_verbose, convert_branch_summary, convert_commit, convert_blame
 from restfulgit.utils.json import jsonify
 from restfulgit.utils.cors import corsify
 from restfulgit.utils.json_err_pages import json_error_page, register_general_error_handler
 from restfulgit.utils.url_converters import RepoConverter, SHAConverter, register_converter
+from restfulgit.utils.url_builders import url_builder_for
+from restfulgit.utils.query_args import get_int_arg
 from restfulgit.utils import mime_types
 
 
+MIME_SNIFF_PREFIX_LEN = 64 * 1024  # bytes
+RAW_CHUNK_SIZE = 64 * 1024  # bytes
+
+
 # Optionally use better libmagic-based MIME-type guessing
 try:
     import magic as libmagic
 except ImportError:
     import mimetypes
+    # A bare MimeTypes() only knows Python's built-in defaults, so explicitly load the same system
+    # MIME type files (e.g. /etc/mime.types) that mimetypes.init() reads
+    MIME_TYPES = mimetypes.MimeTypes(filenames=[filepath for filepath in mimetypes.knownfiles if os.path.isfile(filepath)])
+    # Lowercase extensions which guess_type() maps straight to a type. The system MIME type files also list some
+    # compression extensions (.gz, .tgz, etc.), which guess_type() instead treats as encodings or as aliases
+    # (e.g. .tgz => .tar.gz), so those are left out, as are mixed-case extensions; guess_type() handles all of them.
+    EXTENSION_TO_MIME_TYPE = {
+        extension: mime_type
+        for extension, mime_type in MIME_TYPES.types_map[True].items()
+        if extension == extension.lower() and extension not in MIME_TYPES.suffix_map and extension not in MIME_TYPES.encodings_map
+    }
 
     def guess_mime_type(filename, content):  # pylint: disable=W0613
-        (mime_type, encoding) = mimetypes.guess_type(filename)  # pylint: disable=W0612
+        # Fast path for plain extensions
+        mime_type = EXTENSION_TO_MIME_TYPE.get(os.path.splitext(filename)[1])
+        if mime_type is None:
+            (mime_type, encoding) = MIME_TYPES.guess_type(filename)  # pylint: disable=W0612
         return mime_type
 else:
     import atexit
@@ -35,7 +55,7 @@ else:
     atexit.register(MAGIC.close)
 
     def guess_mime_type(filename, content):  # pylint: disable=W0613
-        return MAGIC.id_buffer(content)
+        return MAGIC.id_buffer(bytes(content[:MIME_SNIFF_PREFIX_LEN]))
 
 
 porcelain = Blueprint('porcelain', __name__)  # pylint: disable=C0103
@@ -48,7 +68,7 @@ register_general_error_handler(porcelain, json_error_page)
 @corsify
 @jsonify
 def get_repo_list():
-    return [convert_repo(repo_key) for repo_key in sorted(get_repo_names())]
+    return (convert_repo(repo_key) for repo_key in get_repo_names())
 
 
 @porcelain.route('/repos/<repo:repo_key>/')
@@ -59,13 +79,19 @@ def get_repo_info(repo_key):
     return convert_repo(repo_key)
 
 
+BRANCH_REF_PREFIX = "refs/heads/"
+
+
 @porcelain.route('/repos/<repo:repo_key>/branches/')
 @corsify
 @jsonify
 def get_branches(repo_key):
     repo = get_repo(repo_key)
-    branches = (repo.lookup_branch(branch_name) for branch_name in repo.listall_branches())
-    return [convert_branch_summary(repo_key, branch) for branch in branches]
+    return (
+        convert_branch_summary(repo_key, reference)
+        for reference in repo.listall_reference_objects()
+        if reference.name.startswith(BRANCH_REF_PREFIX)
+    )
 
 
 @porcelain.route('/repos/<repo:repo_key>/branches/<branch_name>/')
@@ -79,6 +105,8 @@ def get_branch(repo_key, branch_name):
 
 def _is_merged(repo, current_branch, other_branch):
     """Returns a boolean indicating whether the other branch is fully merged into the current branch."""
+    # libgit2's merge base search stops once the two histories meet, whereas a plain ancestry search from
+    # the current branch would have to exhaust its entire history whenever the other branch is *not* merged.
     try:
         merge_base_oid = repo.merge_base(current_branch.target, other_branch.target)
     except KeyError:
@@ -87,19 +115,31 @@ def _is_merged(repo, current_branch, other_branch):
     return merge_base_oid == other_branch.target
 
 
+def _merged_branches(repo, current_branch):
+    """Yields the other branches which are fully merged into the current branch."""
+    is_merged_by_target = {current_branch.target: True}  # a branch at the same commit is trivially merged
+    for other_branch in repo.listall_reference_objects():
+        if not other_branch.name.startswith(BRANCH_REF_PREFIX) or other_branch.name == current_branch.name:
+            continue
+        if other_branch.type == GIT_REF_SYMBOLIC:
+            continue  # points at another branch rather than at a commit, so there's no merge base to compute
+        # branches often share a tip commit, so only compute the merge base once per distinct tip
+        target = other_branch.target
+        merged = is_merged_by_target.get(target)
+        if merged is None:
+            merged = is_merged_by_target[target] = _is_merged(repo, current_branch, other_branch)
+        if merged:
+            yield other_branch
+
+
 @porcelain.route('/repos/<repo:repo_key>/branches/<branch_name>/merged/')
 @corsify
 @jsonify
 def get_merged_branches(repo_key, branch_name):  # NOTE: This endpoint is a RestfulGit extension
     repo = get_repo(repo_key)
     branch = _get_branch(repo, branch_name)
-    other_branches = (
-        repo.lookup_branch(other_branch_name)
-        for other_branch_name in repo.listall_branches()
-        if other_branch_name != branch_name
-    )
-    merged_branches = (other_branch for other_branch in other_branches if _is_merged(repo, branch, other_branch))
-    return [convert_branch_summary(repo_key, merged_branch) for merged_branch in merged_branches]
+    # merge base computations can fail, so build the whole list before committing to a 200 response
+    return [convert_branch_summary(repo_key, merged_branch) for merged_branch in _merged_branches(repo, branch)]
 
 
 @porcelain.route('/repos/<repo:repo_key>/branches/<branch_name>/unique-commits/sorted/<any(topological,chronological):sort>/')
@@ -112,7 +152,9 @@ def get_commits_unique_to_branch(repo_key, branch_name, sort):  # NOTE: This end
         sort = GIT_SORT_TIME | GIT_SORT_REVERSE
     else:
         sort = GIT_SORT_TOPOLOGICAL | GIT_SORT_REVERSE
-    commits = list(_get_commits_unique_to_branch(repo, branch, sort))
+    commits = _get_commits_unique_to_branch(repo, branch, sort)
+    # walking the history can fail partway (e.g. objects missing from a shallow clone), so build the whole list
+    # before committing to a 200 response
     return {
         "commits": [convert_commit(repo_key, repo, commit) for commit in commits]
     }
@@ -121,26 +163,30 @@ def get_commits_unique_to_branch(repo_key, branch_name, sort):  # NOTE: This end
 TAG_REF_PREFIX = "refs/tags/"
 
 
+def _tag_summaries(repo_key, repo):
+    commit_url_for = url_builder_for('porcelain.get_commit', 'branch_or_tag_or_sha', repo_key=repo_key)
+    for tag in repo.listall_reference_objects():
+        if not tag.name.startswith(TAG_REF_PREFIX):
+            continue
+        name = tag.shorthand
+        sha = str(tag.peel().id)
+        yield {
+            "name": name,
+            "commit": {
+                "sha": sha,
+                "url": commit_url_for(sha),
+            },
+            "url": url_for('porcelain.get_tag', _external=True,  # NOTE: This is RestfulGit extension
+                           repo_key=repo_key, tag_name=name),
+        }
+
+
 @porcelain.route('/repos/<repo:repo_key>/tags/')
 @corsify
 @jsonify
 def get_tags(repo_key):
     repo = get_repo(repo_key)
-    ref_names = filter(lambda ref_name: ref_name.startswith(TAG_REF_PREFIX), repo.listall_references())
-    tags = (repo.lookup_reference(ref_name) for ref_name in ref_names)
-    return [
-        {
-            "name": tag.shorthand,
-            "commit": {
-                "sha": str(tag.peel().id),
-                "url": url_for('porcelain.get_commit', _external=True,
-                               repo_key=repo_key, branch_or_tag_or_sha=str(tag.peel().id)),
-            },
-            "url": url_for('porcelain.get_tag', _external=True,  # NOTE: This is RestfulGit extension
-                           repo_key=repo_key, tag_name=tag.shorthand),
-        }
-        for tag in tags
-    ]
+    return list(_tag_summaries(repo_key, repo))  # peeling tags can fail, so don't stream them
 
 
 @porcelain.route('/repos/<repo:repo_key>/tags/<tag_name>/')
@@ -148,17 +194,20 @@ def get_tags(repo_key):
 @jsonify
 def get_tag(repo_key, tag_name):  # NOTE: This endpoint is a RestfulGit extension
     repo = get_repo(repo_key)
-    tag = lookup_ref(repo, TAG_REF_PREFIX + tag_name)
-    if tag is None:
+    try:
+        # the full ref name is known, so skip lookup_ref()'s fallback lookups of other spellings
+        tag = repo.lookup_reference(TAG_REF_PREFIX + tag_name)
+    except (ValueError, KeyError):
         raise NotFound("tag not found")
+    commit = tag.peel()
     result = {
         "name": tag.shorthand,
-        "commit": convert_commit(repo_key, repo, tag.peel()),
+        "commit": convert_commit(repo_key, repo, commit),
         "url": url_for('porcelain.get_tag', _external=True,
                        repo_key=repo_key, tag_name=tag.shorthand),
     }
     # simple tag
-    if tag.target != tag.peel().id:
+    if tag.target != commit.id:
         tag_obj = repo[tag.target]
         result['tag'] = convert_tag(repo_key, repo, tag_obj)
     return result
@@ -181,22 +230,38 @@ def get_contents(repo_key, file_path=''):
     repo = get_repo(repo_key)
     refspec = request.args.get('ref', 'master')
     commit = get_commit_for_refspec(repo, refspec)
-    tree = get_tree(repo, commit.tree.id)
+    tree = get_tree(repo, commit.tree_id)
     obj = get_object_from_path(repo, tree, file_path)
     return _get_contents(repo_key, repo, refspec, file_path, obj)
 
 
+def _iter_chunks(data, chunk_size=RAW_CHUNK_SIZE):
+    for offset in range(0, len(data), chunk_size):
+        yield bytes(data[offset:(offset + chunk_size)])
+
+
 @porcelain.route('/repos/<repo:repo_key>/raw/<branch_or_tag_or_sha>/<path:file_path>')
 @corsify
 def get_raw(repo_key, branch_or_tag_or_sha, file_path):
     repo = get_repo(repo_key)
     commit = get_commit_for_refspec(repo, branch_or_tag_or_sha)
-    tree = get_tree(repo, commit.tree.id)
-    data = get_raw_file_content(repo, tree, file_path)
+    tree = get_tree(repo, commit.tree_id)
+    blob = get_raw_file_blob(repo, tree, file_path)
+    data = memoryview(blob)  # reads straight from libgit2's copy of the blob instead of making our own
     mime_type = guess_mime_type(os.path.basename(file_path), data)
     if mime_type is None:
         mime_type = mime_types.OCTET_STREAM
-    return Response(data, mimetype=mime_type)
+    resp = Response(_iter_chunks(data), mimetype=mime_type, direct_passthrough=True)
+    resp.content_length = len(data)
+    return resp
+
+
+def _iter_patch_text(diff):
+    # Same text as diff.patch, but one file at a time rather than the whole diff in a single string
+    for patch in diff:
+        text = patch.text
+        if text:
+            yield text
 
 
 @porcelain.route('/repos/<repo:repo_key>/commit/<branch_or_tag_or_sha>.diff')
@@ -205,63 +270,39 @@ def get_diff(repo_key, branch_or_tag_or_sha=None):
     repo = get_repo(repo_key)
     commit = get_commit_for_refspec(repo, branch_or_tag_or_sha)
     diff = _get_diff(repo, commit)
-    return Response(diff.patch or '', mimetype=mime_types.DIFF)
+    return Response(_iter_patch_text(diff), mimetype=mime_types.DIFF)
 
 
 @porcelain.route('/repos/<repo:repo_key>/compare/<old_branch_or_tag_or_sha>...<new_branch_or_tag_or_sha>.diff')
 @corsify
 def get_compare_diff(repo_key, old_branch_or_tag_or_sha, new_branch_or_tag_or_sha):
-    context = request.args.get('context', 3)  # NOTE: The `context` parameter is a RestfulGit extension
-    try:
-        context = int(context)
-    except ValueError:
-        raise BadRequest("context was not a valid integer")
-    if context < 0:
-        raise BadRequest("context must not non negative")
+    context = get_int_arg('context', default=3, minimum=0)  # NOTE: The `context` parameter is a RestfulGit extension
 
     repo = get_repo(repo_key)
     old_commit = get_commit_for_refspec(repo, old_branch_or_tag_or_sha)
     new_commit = get_commit_for_refspec(repo, new_branch_or_tag_or_sha)
     diff = _get_diff(repo, new_commit, against=old_commit, context_lines=context)
-    return Response(diff.patch or '', mimetype=mime_types.DIFF)
+    return Response(_iter_patch_text(diff), mimetype=mime_types.DIFF)
 
 
 @porcelain.route('/repos/<repo:repo_key>/blame/<branch_or_tag_or_sha>/<path:file_path>')  # NOTE: This endpoint is a RestfulGit extension
 @corsify
 @jsonify
 def get_blame(repo_key, branch_or_tag_or_sha, file_path):
-    min_line = request.args.get('firstLine')
-    if min_line is None:
-        min_line = 1
-    try:
-        min_line = int(min_line)
-    except ValueError:
-        raise BadRequest("firstLine was not a valid integer")
-    if min_line < 1:
-        raise BadRequest("firstLine must be positive")
-
-    max_line = request.args.get('lastLine')
-    if max_line is not None:
-        try:
-            max_line = int(max_line)
-        except ValueError:
-            raise BadRequest("lastLine was not a valid integer")
-        if max_line < 1:
-            raise BadRequest("lastLine must be positive")
-
-        if min_line > max_line:
-            raise BadRequest("firstLine cannot be greater than lastLine")
+    min_line = get_int_arg('firstLine', default=1, minimum=1)
+    max_line = get_int_arg('lastLine', minimum=1)
+    if max_line is not None and min_line > max_line:
+        raise BadRequest("firstLine cannot be greater than lastLine")
 
     repo = get_repo(repo_key)
     newest_commit = get_commit_for_refspec(repo, branch_or_tag_or_sha)
     tree = get_tree(repo, newest_commit.tree_id)
 
-    raw_lines = get_raw_file_content(repo, tree, file_path).splitlines()
-    if min_line > len(raw_lines):
+    raw_lines, line_count = split_line_range(get_raw_file_content(repo, tree, file_path), min_line, max_line)
+    if min_line > line_count:
         raise BadRequest("firstLine out of bounds")
-    if max_line is not None and max_line > len(raw_lines):
+    if max_line is not None and max_line > line_count:
         raise BadRequest("lastLine out of bounds")
-    raw_lines = raw_lines[(min_line - 1):max_line]
 
     blame = _get_blame(
         repo,
@@ -280,20 +321,18 @@ def get_blame(repo_key, branch_or_tag_or_sha, file_path):
 @jsonify
 def get_contributors(repo_key):
     repo = get_repo(repo_key)
-    authors = get_authors(repo)
+    commit_counts = Counter()
     email_to_name = {}
-    commit_counts = defaultdict(int)
-    for author in authors:
+    for author in get_authors(repo):
         email = author.email
-        email_to_name.setdefault(email, author.name)
         commit_counts[email] += 1
-    leaderboard = list(commit_counts.items())
-    leaderboard.sort(key=(lambda pair: pair[1]), reverse=True)
+        if email not in email_to_name:
+            email_to_name[email] = author.name  # only decode each contributor's name once
     return [
         {
             "email": email,  # NOTE: This is RestfulGit extension
             "name": email_to_name[email],
             "contributions": commit_count,
         }
-        for email, commit_count in leaderboard
+        for email, commit_count in commit_counts.most_common()
     ]
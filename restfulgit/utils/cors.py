@@ -1,39 +1,71 @@
 # coding=utf-8
 
 
-from functools import wraps
+from functools import wraps, lru_cache
 
 from flask import current_app, request, make_response
 
 
+CORS_HEADERS_CACHE_SIZE = 16  # distinct CORS configs
+
+
+@lru_cache(maxsize=CORS_HEADERS_CACHE_SIZE)
+def _static_cors_headers(allowed_origin, allow_credentials, allowed_headers, max_age):
+    """
+    Returns the CORS response headers which only depend on the config, formatted once per distinct config.
+    Keyed on the config values themselves since the config may be changed while the app is running.
+    """
+    headers = [
+        ('Access-Control-Allow-Origin', allowed_origin),
+        ('Access-Control-Allow-Credentials', str(allow_credentials).lower()),
+    ]
+    if allowed_headers:
+        headers.append(('Access-Control-Allow-Headers', ", ".join(allowed_headers)))
+    if max_age is not None:
+        headers.append(('Access-Control-Max-Age', str(int(max_age.total_seconds()))))
+    return tuple(headers)
+
+
 def corsify(func):
     # based on http://flask.pocoo.org/snippets/56/
     func.provide_automatic_options = False
     required_methods = set(getattr(func, 'required_methods', ()))
     required_methods.add('OPTIONS')
     func.required_methods = required_methods
+    allowed_methods_by_rule = {}  # URL rule => value of the Access-Control-Allow-Methods header
+
+    def allowed_methods():
+        # Same methods as the Allow header of the default OPTIONS response, but without building
+        # that response or re-scanning the URL map on every request
+        url_rule = request.url_rule
+        methods = allowed_methods_by_rule.get(url_rule.rule)
+        if methods is None:
+            methods = allowed_methods_by_rule[url_rule.rule] = ", ".join(sorted(url_rule.methods))
+        return methods
 
     @wraps(func)
     def wrapped(*args, **kwargs):
+        # Cheap fast path when CORS is disabled. This is checked per request (rather than once at startup)
+        # because the config may legitimately be changed after the app has been created.
         if not current_app.config['RESTFULGIT_ENABLE_CORS']:
             return func(*args, **kwargs)
-        options_resp = current_app.make_default_options_response()
         if request.method == 'OPTIONS':
-            resp = options_resp
+            resp = current_app.make_default_options_response()
         else:
             resp = make_response(func(*args, **kwargs))
         headers = resp.headers
-        options_header_allow = options_resp.headers.get('allow')
-        if options_header_allow:
-            headers['Access-Control-Allow-Methods'] = options_header_allow
-        headers['Access-Control-Allow-Origin'] = current_app.config['RESTFULGIT_CORS_ALLOWED_ORIGIN']
-        headers['Access-Control-Allow-Credentials'] = str(current_app.config['RESTFULGIT_CORS_ALLOW_CREDENTIALS']).lower()
-        allowed_headers = current_app.config['RESTFULGIT_CORS_ALLOWED_HEADERS']
-        if allowed_headers:
-            headers['Access-Control-Allow-Headers'] = ", ".join(allowed_headers)
-        max_age = current_app.config['RESTFULGIT_CORS_MAX_AGE']
-        if max_age is not None:
-            headers['Access-Control-Max-Age'] = str(int(max_age.total_seconds()))
+        allow = allowed_methods()
+        if allow:
+            headers['Access-Control-Allow-Methods'] = allow
+        config = current_app.config
+        static_headers = _static_cors_headers(
+            config['RESTFULGIT_CORS_ALLOWED_ORIGIN'],
+            config['RESTFULGIT_CORS_ALLOW_CREDENTIALS'],
+            tuple(config['RESTFULGIT_CORS_ALLOWED_HEADERS']),
+            config['RESTFULGIT_CORS_MAX_AGE'],
+        )
+        for name, value in static_headers:
+            headers[name] = value
         return resp
 
     return wrapped
@@ -1,22 +1,78 @@
 # coding=utf-8
 
 
-from json import dumps
 from functools import wraps
+from types import GeneratorType
 
-from flask import Response
+from flask import Response, stream_with_context
 
 from restfulgit.utils import mime_types
 from restfulgit.utils.timezones import UTC
 
 
-def jsonify(func):
-    def dthandler(obj):
-        if hasattr(obj, 'isoformat'):
-            return obj.astimezone(UTC).replace(tzinfo=None).isoformat() + 'Z'
+def _dthandler(obj):
+    if hasattr(obj, 'isoformat'):
+        return obj.astimezone(UTC).replace(tzinfo=None).isoformat() + 'Z'
+
+
+# Optionally use the much faster orjson serializer
+try:
+    import orjson
+    from orjson import OPT_UTC_Z  # requires orjson >= 3
+except ImportError:
+    from json import dumps as _json_dumps
+
+    def dumps(obj):
+        return _json_dumps(obj, default=_dthandler)
+else:
+    def dumps(obj):
+        # orjson formats datetimes itself; ours are always in UTC, so this yields the same "...Z" form as _dthandler
+        return orjson.dumps(obj, default=_dthandler, option=OPT_UTC_Z)
+
+
+def _stream_json_array(items):
+    yield '['
+    for index, item in enumerate(items):
+        if index:
+            yield ','
+        yield dumps(item)
+    yield ']'
 
+
+def _stream_json_object(obj):
+    yield '{'
+    for index, (key, value) in enumerate(obj.items()):
+        if index:
+            yield ','
+        yield dumps(key)
+        yield ':'
+        if isinstance(value, GeneratorType):
+            yield from _stream_json_array(value)
+        else:
+            yield dumps(value)
+    yield '}'
+
+
+def _is_streamable(result):
+    if isinstance(result, GeneratorType):
+        return True
+    return isinstance(result, dict) and any(isinstance(value, GeneratorType) for value in result.values())
+
+
+def jsonify(func):
+    """
+    Serializes the wrapped view's return value as the JSON response.
+    If the view returns a generator (or a dict with generators as values), each generator's items are
+    streamed out as a JSON array one at a time instead.
+    Any validation (e.g. 404s) must therefore happen before the generator is returned,
+    and views whose per-item work can raise errors should return a list instead,
+    since by the time a generator raises, the 200 status has already been sent.
+    """
     @wraps(func)
     def wrapped(*args, **kwargs):
-        return Response(dumps(func(*args, **kwargs), default=dthandler),
-                        mimetype=mime_types.JSON)
+        result = func(*args, **kwargs)
+        if _is_streamable(result):
+            chunks = (_stream_json_array(result) if isinstance(result, GeneratorType) else _stream_json_object(result))
+            return Response(stream_with_context(chunks), mimetype=mime_types.JSON)
+        return Response(dumps(result), mimetype=mime_types.JSON)
     return wrapped
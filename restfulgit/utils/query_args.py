@@ -0,0 +1,22 @@
+# coding=utf-8
+
+
+from flask import request
+from werkzeug.exceptions import BadRequest
+
+
+def get_int_arg(name, default=None, minimum=None):
+    """
+    Returns the named query string parameter as an int, or `default` if the parameter wasn't given.
+    Raises BadRequest if the parameter isn't a valid integer or is less than `minimum`.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest(f"{name} was not a valid integer") from None
+    if minimum is not None and value < minimum:
+        raise BadRequest(f"{name} must be at least {minimum}")
+    return value
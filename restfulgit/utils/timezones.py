@@ -8,7 +8,7 @@ class FixedOffset(tzinfo):
     ZERO = timedelta(0)
 
     def __init__(self, offset):
-        super(FixedOffset, self).__init__()
+        super().__init__()
         self._offset = timedelta(minutes=offset)
 
     def utcoffset(self, dt):  # pylint: disable=W0613
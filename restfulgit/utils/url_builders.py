@@ -0,0 +1,26 @@
+# coding=utf-8
+
+
+from flask import g, url_for
+
+
+_PLACEHOLDER = 'RESTFULGIT0PLACEHOLDER'  # passes through URL converters and quoting unchanged
+
+
+def url_builder_for(endpoint, vary, **values):
+    """
+    Returns a function which builds the same external URL as url_for(endpoint, **values) with `vary` set to its argument,
+    but only calls url_for() once per endpoint & values per request.
+    Only suitable for arguments (such as SHAs) which URL building never escapes or otherwise transforms.
+    """
+    cache = g.setdefault('_restfulgit_url_builders', {})
+    key = (endpoint, vary, tuple(sorted(values.items())))
+    affixes = cache.get(key)
+    if affixes is None:
+        values[vary] = _PLACEHOLDER
+        affixes = cache[key] = tuple(url_for(endpoint, _external=True, **values).split(_PLACEHOLDER, 1))
+    prefix, suffix = affixes
+
+    def build(value):
+        return prefix + value + suffix
+    return build
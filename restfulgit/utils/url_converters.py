@@ -14,10 +14,14 @@ class SHAConverter(BaseConverter):  # pylint: disable=W0232
     regex = r'(?:[0-9a-fA-F]{1,40})'
 
 
+def repo_key_to_url(repo_key):
+    return repo_key.replace(';', ';;').replace('/', ';')
+
+
 class RepoConverter(BaseConverter):
 
     def to_python(self, value):
         return value.replace(';', '/').replace(';;', ';')
 
     def to_url(self, value):
-        return value.replace(';', ';;').replace('/', ';')
+        return repo_key_to_url(value)
@@ -49,5 +49,6 @@ setup(
     provides=[NAME],
     packages=find_packages(exclude=['tests']),
     zip_safe=True,
+    python_requires='>=3.7',
     install_requires=requirements
 )
@@ -2,23 +2,32 @@
 
 
 import unittest
+from unittest import mock
 from hashlib import sha512
+import mimetypes
 import os
 import os.path
+import threading
+from itertools import count
 import io
 from base64 import b64decode
-from contextlib import contextmanager
+from contextlib import contextmanager, suppress
 from datetime import timedelta
 from tempfile import mkdtemp, mkstemp
 from shutil import rmtree
 from subprocess import check_call
 from json import load as load_json_file
-from time import time as time_now
+from time import time as time_now, sleep
 
 from flask_testing import TestCase as _FlaskTestCase
+from werkzeug.exceptions import BadRequest
 import pygit2
 
 from restfulgit.app_factory import create_app
+from restfulgit.porcelain import routes as porcelain_routes
+from restfulgit.archives import _prefetched
+from restfulgit.porcelain.retrieval import split_line_range, _REPO_NAMES_CACHE
+from restfulgit.utils.query_args import get_int_arg
 
 
 RESTFULGIT_REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -28,8 +37,6 @@ CONFIG_FILE = os.path.join(RESTFULGIT_REPO, 'example_config.py')
 
 TEST_SUBDIR = os.path.join(RESTFULGIT_REPO, 'tests')
 FIXTURES_DIR = os.path.join(TEST_SUBDIR, 'fixtures')
-GIT_MIRROR_DESCRIPTION_FILEPATH = os.path.join(RESTFULGIT_REPO, 'description')
-NORMAL_CLONE_DESCRIPTION_FILEPATH = os.path.join(RESTFULGIT_REPO, '.git', 'description')
 FIRST_COMMIT = "07b9bf1540305153ceeb4519a50b588c35a35464"
 TREE_OF_FIRST_COMMIT = "6ca22167185c31554aa6157306e68dfd612d6345"
 BLOB_FROM_FIRST_COMMIT = "ae9d90706c632c26023ce599ac96cb152673da7c"
@@ -40,18 +47,29 @@ IMPROBABLE_SHA = "f" * 40
 
 
 def delete_file_quietly(filepath):
-    try:
+    with suppress(EnvironmentError):
         os.remove(filepath)
-    except EnvironmentError as err:
-        pass
 
 
 class _RestfulGitTestCase(_FlaskTestCase):
+    # Building the app is the same for every test, so only do it once; tearDown() undoes any per-test config changes.
+    _shared_app = None
+    _pristine_config = None
+
     def create_app(self):
-        app = create_app()
-        app.config.from_pyfile(CONFIG_FILE)
-        app.config['RESTFULGIT_REPO_BASE_PATH'] = PARENT_DIR_OF_RESTFULGIT_REPO
-        return app
+        if _RestfulGitTestCase._shared_app is None:
+            app = create_app()
+            app.config.from_pyfile(CONFIG_FILE)
+            app.config['RESTFULGIT_REPO_BASE_PATH'] = PARENT_DIR_OF_RESTFULGIT_REPO
+            _RestfulGitTestCase._shared_app = app
+            _RestfulGitTestCase._pristine_config = dict(app.config)
+        return _RestfulGitTestCase._shared_app
+
+    def tearDown(self):
+        config = self.app.config
+        config.clear()
+        config.update(self._pristine_config)
+        _REPO_NAMES_CACHE.clear()  # the repo list cache outlives requests, so don't let it leak between tests
 
     def assertJsonError(self, resp):
         json = resp.json
@@ -256,6 +274,36 @@ class RepoKeyTestCase(_RestfulGitTestCase):
             self.assertEquals(repo_names, {
                 'onedir/bare.git', 'second/more/nested/repo'})
 
+    def test_repo_list_cache_expires(self):
+        self.app.config['RESTFULGIT_REPO_LIST_CACHE_TIMEOUT'] = timedelta(seconds=10)
+        with self.temporary_directory(suffix='.restfulgit') as temp_repos_dir, \
+                mock.patch('restfulgit.porcelain.retrieval.time') as mock_time:
+            self.app.config['RESTFULGIT_REPO_BASE_PATH'] = temp_repos_dir
+            mock_time.monotonic.return_value = 1000.0
+            pygit2.init_repository(os.path.join(temp_repos_dir, 'first'))
+            resp = self.client.get('/repos/')
+            self.assertEqual([repo['name'] for repo in resp.json], ['first'])
+
+            pygit2.init_repository(os.path.join(temp_repos_dir, 'second'))
+            mock_time.monotonic.return_value = 1009.0
+            resp = self.client.get('/repos/')
+            self.assertEqual([repo['name'] for repo in resp.json], ['first'])  # still cached
+
+            mock_time.monotonic.return_value = 1010.0
+            resp = self.client.get('/repos/')
+            self.assertEqual([repo['name'] for repo in resp.json], ['first', 'second'])
+
+    def test_repo_list_cache_disabled_by_zero_timeout(self):
+        self.app.config['RESTFULGIT_REPO_LIST_CACHE_TIMEOUT'] = timedelta(0)
+        with self.temporary_directory(suffix='.restfulgit') as temp_repos_dir:
+            self.app.config['RESTFULGIT_REPO_BASE_PATH'] = temp_repos_dir
+            resp = self.client.get('/repos/')
+            self.assertEqual(resp.json, [])
+
+            pygit2.init_repository(os.path.join(temp_repos_dir, 'example'))
+            resp = self.client.get('/repos/')
+            self.assertEqual([repo['name'] for repo in resp.json], ['example'])
+
 
 class SHAConverterTestCase(_RestfulGitTestCase):
     def test_empty_sha_rejected(self):
@@ -1162,6 +1210,16 @@ class SimpleSHATestCase(_RestfulGitTestCase):
         resp = self.client.get('/repos/restfulgit/branches/this-branch-does-not-exist/merged/')
         self.assertJson404(resp)
 
+    def test_get_merged_branches_skips_symbolic_branches(self):
+        with self._base_repo_and_commit as pair:
+            repo, a = pair
+            self._commit(repo, "B", [a], with_branch=True)
+            # a symbolic branch points at another branch rather than at a commit, so it has no merge base
+            repo.create_reference_symbolic('refs/heads/symbolic', 'refs/heads/A', False)
+            resp = self.client.get('/repos/example/branches/B/merged/')
+        self.assert200(resp)
+        self.assertEqual([branch['name'] for branch in resp.json], ['A'])
+
     def test_get_repo_commit_works(self):
         # From https://api.github.com/repos/hulu/restfulgit/commits/d408fc2428bc6444cabd7f7b46edbe70b6992b16 with necessary adjustments
         reference = {
@@ -1391,6 +1449,11 @@ class SimpleSHATestCase(_RestfulGitTestCase):
         resp = self.client.get('/repos/restfulgit/commits/{}/'.format(IMPROBABLE_SHA))
         self.assertJson404(resp)
 
+    def test_get_repo_commit_with_full_tag_sha(self):
+        resp = self.client.get('/repos/restfulgit/commits/{}/'.format(TAG_FOR_FIRST_COMMIT))
+        self.assert200(resp)
+        self.assertEqual(resp.json['sha'], FIRST_COMMIT)
+
     def test_get_diff_works(self):
         resp = self.client.get('/repos/restfulgit/commit/d408fc2428bc6444cabd7f7b46edbe70b6992b16.diff')
         self.assert200(resp)
@@ -1495,6 +1558,43 @@ class RawFileTestCase(_RestfulGitTestCase):
         # FIXME: implement
         pass
 
+    @unittest.skipIf(hasattr(porcelain_routes, 'MAGIC'), "libmagic guesses MIME types from content rather than filename")
+    def test_mime_type_from_system_mime_types_file(self):
+        builtin_types = mimetypes.MimeTypes().types_map[True]
+        system_types = mimetypes.MimeTypes(filenames=[filepath for filepath in mimetypes.knownfiles if os.path.isfile(filepath)]).types_map[True]
+        compression_extensions = set(mimetypes.suffix_map) | set(mimetypes.encodings_map)
+        system_only_extensions = sorted(set(system_types) - set(builtin_types) - compression_extensions)
+        if not system_only_extensions:
+            self.skipTest("no system MIME types file defines any extra extensions")
+        extension = system_only_extensions[0]
+        with self._base_repo_and_commit as pair:
+            repo, a = pair
+            filename = 'example' + extension
+            commit = self._commit(repo, filename, [a])
+            resp = self.client.get('/repos/example/raw/{}/{}'.format(commit, filename))
+        self.assert200(resp)
+        self.assertEqual(resp.mimetype, system_types[extension])
+
+    def _get_raw_mime_type(self, filename):
+        with self._base_repo_and_commit as pair:
+            repo, a = pair
+            commit = self._commit(repo, filename, [a])
+            resp = self.client.get('/repos/example/raw/{}/{}'.format(commit, filename))
+        self.assert200(resp)
+        return resp.mimetype
+
+    @unittest.skipIf(hasattr(porcelain_routes, 'MAGIC'), "libmagic guesses MIME types from content rather than filename")
+    def test_mime_type_of_gzipped_tarball(self):
+        self.assertEqual(self._get_raw_mime_type('example.tar.gz'), 'application/x-tar')
+
+    @unittest.skipIf(hasattr(porcelain_routes, 'MAGIC'), "libmagic guesses MIME types from content rather than filename")
+    def test_mime_type_of_tgz(self):
+        self.assertEqual(self._get_raw_mime_type('example.tgz'), 'application/x-tar')
+
+    @unittest.skipIf(hasattr(porcelain_routes, 'MAGIC'), "libmagic guesses MIME types from content rather than filename")
+    def test_mime_type_of_bare_gzip_file(self):
+        self.assertEqual(self._get_raw_mime_type('example.gz'), 'application/octet-stream')
+
     def test_tags_trump_branches(self):
         # branch "ambiguous" = commit 1f51b91
         #     api.py's SHA-512 = e948e8d0b0d0703d972279382a002c90040ff19d636e96927262d63e1f1429526539ea781744d2f3a65a5938b59e0c5f57adadc26f797480efcfc6f7dcff3d81
@@ -1533,10 +1633,24 @@ class RawFileTestCase(_RestfulGitTestCase):
 
 
 class RepositoryInfoCase(_RestfulGitTestCase):
+    @contextmanager
+    def _scratch_repo(self):
+        """
+        Sets up an empty repo named "restfulgit" in a temporary directory, so that tests can freely write & delete
+        its description files without touching the real repo being tested.
+        Yields the git-mirror-style and normal-clone-style description filepaths.
+        """
+        with self.temporary_directory(suffix='.restfulgit') as temp_repos_dir:
+            self.app.config['RESTFULGIT_REPO_BASE_PATH'] = temp_repos_dir
+            repo_dir = os.path.join(temp_repos_dir, 'restfulgit')
+            pygit2.init_repository(repo_dir)
+            yield os.path.join(repo_dir, 'description'), os.path.join(repo_dir, '.git', 'description')
+
     def test_no_description_file(self):
-        delete_file_quietly(NORMAL_CLONE_DESCRIPTION_FILEPATH)
-        delete_file_quietly(GIT_MIRROR_DESCRIPTION_FILEPATH)
-        resp = self.client.get('/repos/restfulgit/')
+        with self._scratch_repo() as (git_mirror_description_filepath, normal_clone_description_filepath):
+            delete_file_quietly(normal_clone_description_filepath)
+            delete_file_quietly(git_mirror_description_filepath)
+            resp = self.client.get('/repos/restfulgit/')
         self.assert200(resp)
         self.assertEqual(
             resp.json,
@@ -1557,30 +1671,28 @@ class RepositoryInfoCase(_RestfulGitTestCase):
         )
 
     def test_default_description_file(self):
-        with io.open(NORMAL_CLONE_DESCRIPTION_FILEPATH, mode='wt', encoding='utf-8') as description_file:
-            description_file.write("Unnamed repository; edit this file 'description' to name the repository.\n")
-        try:
+        with self._scratch_repo() as (_, normal_clone_description_filepath):
+            with io.open(normal_clone_description_filepath, mode='wt', encoding='utf-8') as description_file:
+                description_file.write("Unnamed repository; edit this file 'description' to name the repository.\n")
             resp = self.client.get('/repos/restfulgit/')
-            self.assert200(resp)
-            self.assertEqual(
-                resp.json,
-                {
-                    'blobs_url': 'http://localhost/repos/restfulgit/git/blobs{/sha}',
-                    'branches_url': 'http://localhost/repos/restfulgit/branches{/branch}',
-                    'commits_url': 'http://localhost/repos/restfulgit/commits{/sha}',
-                    'description': None,
-                    'full_name': 'restfulgit',
-                    'git_commits_url': 'http://localhost/repos/restfulgit/git/commits{/sha}',
-                    'git_refs_url': 'http://localhost/repos/restfulgit/git/refs{/sha}',
-                    'git_tags_url': 'http://localhost/repos/restfulgit/git/tags{/sha}',
-                    'name': 'restfulgit',
-                    'tags_url': 'http://localhost/repos/restfulgit/tags/',
-                    'trees_url': 'http://localhost/repos/restfulgit/git/trees{/sha}',
-                    'url': 'http://localhost/repos/restfulgit/',
-                }
-            )
-        finally:
-            delete_file_quietly(NORMAL_CLONE_DESCRIPTION_FILEPATH)
+        self.assert200(resp)
+        self.assertEqual(
+            resp.json,
+            {
+                'blobs_url': 'http://localhost/repos/restfulgit/git/blobs{/sha}',
+                'branches_url': 'http://localhost/repos/restfulgit/branches{/branch}',
+                'commits_url': 'http://localhost/repos/restfulgit/commits{/sha}',
+                'description': None,
+                'full_name': 'restfulgit',
+                'git_commits_url': 'http://localhost/repos/restfulgit/git/commits{/sha}',
+                'git_refs_url': 'http://localhost/repos/restfulgit/git/refs{/sha}',
+                'git_tags_url': 'http://localhost/repos/restfulgit/git/tags{/sha}',
+                'name': 'restfulgit',
+                'tags_url': 'http://localhost/repos/restfulgit/tags/',
+                'trees_url': 'http://localhost/repos/restfulgit/git/trees{/sha}',
+                'url': 'http://localhost/repos/restfulgit/',
+            }
+        )
 
     def test_dot_dot_disallowed(self):
         self.app.config['RESTFULGIT_REPO_BASE_PATH'] = TEST_SUBDIR
@@ -1594,55 +1706,51 @@ class RepositoryInfoCase(_RestfulGitTestCase):
 
     def test_works_normal_clone(self):
         description = "REST API for Git data\n"
-        with io.open(NORMAL_CLONE_DESCRIPTION_FILEPATH, mode='wt', encoding='utf-8') as description_file:
-            description_file.write(description)
-        try:
+        with self._scratch_repo() as (_, normal_clone_description_filepath):
+            with io.open(normal_clone_description_filepath, mode='wt', encoding='utf-8') as description_file:
+                description_file.write(description)
             resp = self.client.get('/repos/restfulgit/')
-            self.assertEqual(
-                resp.json,
-                {
-                    'blobs_url': 'http://localhost/repos/restfulgit/git/blobs{/sha}',
-                    'branches_url': 'http://localhost/repos/restfulgit/branches{/branch}',
-                    'commits_url': 'http://localhost/repos/restfulgit/commits{/sha}',
-                    'description': description,
-                    'full_name': 'restfulgit',
-                    'git_commits_url': 'http://localhost/repos/restfulgit/git/commits{/sha}',
-                    'git_refs_url': 'http://localhost/repos/restfulgit/git/refs{/sha}',
-                    'git_tags_url': 'http://localhost/repos/restfulgit/git/tags{/sha}',
-                    'name': 'restfulgit',
-                    'tags_url': 'http://localhost/repos/restfulgit/tags/',
-                    'trees_url': 'http://localhost/repos/restfulgit/git/trees{/sha}',
-                    'url': 'http://localhost/repos/restfulgit/',
-                }
-            )
-        finally:
-            delete_file_quietly(NORMAL_CLONE_DESCRIPTION_FILEPATH)
+        self.assertEqual(
+            resp.json,
+            {
+                'blobs_url': 'http://localhost/repos/restfulgit/git/blobs{/sha}',
+                'branches_url': 'http://localhost/repos/restfulgit/branches{/branch}',
+                'commits_url': 'http://localhost/repos/restfulgit/commits{/sha}',
+                'description': description,
+                'full_name': 'restfulgit',
+                'git_commits_url': 'http://localhost/repos/restfulgit/git/commits{/sha}',
+                'git_refs_url': 'http://localhost/repos/restfulgit/git/refs{/sha}',
+                'git_tags_url': 'http://localhost/repos/restfulgit/git/tags{/sha}',
+                'name': 'restfulgit',
+                'tags_url': 'http://localhost/repos/restfulgit/tags/',
+                'trees_url': 'http://localhost/repos/restfulgit/git/trees{/sha}',
+                'url': 'http://localhost/repos/restfulgit/',
+            }
+        )
 
     def test_works_git_mirror(self):
         description = "REST API for Git data\n"
-        with io.open(GIT_MIRROR_DESCRIPTION_FILEPATH, mode='wt', encoding='utf-8') as description_file:
-            description_file.write(description)
-        try:
+        with self._scratch_repo() as (git_mirror_description_filepath, _):
+            with io.open(git_mirror_description_filepath, mode='wt', encoding='utf-8') as description_file:
+                description_file.write(description)
             resp = self.client.get('/repos/restfulgit/')
-            self.assertEqual(
-                resp.json,
-                {
-                    'blobs_url': 'http://localhost/repos/restfulgit/git/blobs{/sha}',
-                    'branches_url': 'http://localhost/repos/restfulgit/branches{/branch}',
-                    'commits_url': 'http://localhost/repos/restfulgit/commits{/sha}',
-                    'description': description,
-                    'full_name': 'restfulgit',
-                    'git_commits_url': 'http://localhost/repos/restfulgit/git/commits{/sha}',
-                    'git_refs_url': 'http://localhost/repos/restfulgit/git/refs{/sha}',
-                    'git_tags_url': 'http://localhost/repos/restfulgit/git/tags{/sha}',
-                    'name': 'restfulgit',
-                    'tags_url': 'http://localhost/repos/restfulgit/tags/',
-                    'trees_url': 'http://localhost/repos/restfulgit/git/trees{/sha}',
-                    'url': 'http://localhost/repos/restfulgit/',
-                }
-            )
-        finally:
-            delete_file_quietly(GIT_MIRROR_DESCRIPTION_FILEPATH)
+        self.assertEqual(
+            resp.json,
+            {
+                'blobs_url': 'http://localhost/repos/restfulgit/git/blobs{/sha}',
+                'branches_url': 'http://localhost/repos/restfulgit/branches{/branch}',
+                'commits_url': 'http://localhost/repos/restfulgit/commits{/sha}',
+                'description': description,
+                'full_name': 'restfulgit',
+                'git_commits_url': 'http://localhost/repos/restfulgit/git/commits{/sha}',
+                'git_refs_url': 'http://localhost/repos/restfulgit/git/refs{/sha}',
+                'git_tags_url': 'http://localhost/repos/restfulgit/git/tags{/sha}',
+                'name': 'restfulgit',
+                'tags_url': 'http://localhost/repos/restfulgit/tags/',
+                'trees_url': 'http://localhost/repos/restfulgit/git/trees{/sha}',
+                'url': 'http://localhost/repos/restfulgit/',
+            }
+        )
 
 
 class CorsTestCase(_RestfulGitTestCase):
@@ -1735,6 +1843,47 @@ class CorsTestCase(_RestfulGitTestCase):
             self.assert_header_equal('Access-Control-Allow-Methods', 'HEAD, OPTIONS, GET')
 
 
+class PrefetchTestCase(unittest.TestCase):
+    @staticmethod
+    def _live_prefetch_threads():
+        return [thread for thread in threading.enumerate() if thread.name == 'restfulgit-archive-prefetch']
+
+    def _assert_prefetch_threads_exit(self):
+        for _ in range(50):
+            if not self._live_prefetch_threads():
+                return
+            sleep(0.1)
+        self.fail("prefetch thread is still running")
+
+    def test_preserves_items_and_order(self):
+        items = list(range(100))
+        self.assertEqual(list(_prefetched(iter(items), max_prefetch=4)), items)
+        self._assert_prefetch_threads_exit()
+
+    def test_empty_iterable(self):
+        self.assertEqual(list(_prefetched(iter([]))), [])
+        self._assert_prefetch_threads_exit()
+
+    def test_producer_exception_reraised_in_consumer(self):
+        def failing_items():
+            yield 1
+            yield 2
+            raise KeyError("missing object")
+
+        received = []
+        with self.assertRaises(KeyError):
+            for item in _prefetched(failing_items()):
+                received.append(item)
+        self.assertEqual(received, [1, 2])
+        self._assert_prefetch_threads_exit()
+
+    def test_early_close_stops_producer(self):
+        prefetched = _prefetched(count(), max_prefetch=2)  # the producer would never run out on its own
+        self.assertEqual([next(prefetched) for _ in range(3)], [0, 1, 2])
+        prefetched.close()
+        self._assert_prefetch_threads_exit()
+
+
 class ArchiveDownloadTestCase(_RestfulGitTestCase):
     def run_command_quietly(self, args):
         with open(os.devnull, 'wb') as blackhole:
@@ -1859,6 +2008,52 @@ class ArchiveDownloadTestCase(_RestfulGitTestCase):
         self.assertJson404(resp)
 
 
+class SplitLineRangeTestCase(unittest.TestCase):
+    def assertSplitsLikeSplitlines(self, data, first_line, last_line=None):
+        lines = data.splitlines()
+        self.assertEqual(split_line_range(data, first_line, last_line), (lines[(first_line - 1):last_line], len(lines)))
+
+    def test_whole_file(self):
+        self.assertEqual(split_line_range(b'a\nb\n', 1), ([b'a', b'b'], 2))
+        self.assertSplitsLikeSplitlines(b'a\nb\n', 1)
+        self.assertSplitsLikeSplitlines(b'', 1)
+
+    def test_line_range(self):
+        data = b'a\nb\nc\nd\n'
+        self.assertEqual(split_line_range(data, 2, 3), ([b'b', b'c'], 4))
+        for first_line in range(1, 5):
+            for last_line in range(first_line, 5):
+                self.assertSplitsLikeSplitlines(data, first_line, last_line)
+
+    def test_no_final_newline(self):
+        data = b'a\nb\nc'
+        self.assertEqual(split_line_range(data, 3), ([b'c'], 3))
+        for first_line in range(1, 4):
+            for last_line in (None, 1, 2, 3):
+                self.assertSplitsLikeSplitlines(data, first_line, last_line)
+
+    def test_crlf(self):
+        data = b'a\r\nb\r\nc'
+        self.assertEqual(split_line_range(data, 2, 2), ([b'b'], 3))
+        for first_line in range(1, 4):
+            for last_line in (None, 1, 2, 3):
+                self.assertSplitsLikeSplitlines(data, first_line, last_line)
+        self.assertSplitsLikeSplitlines(b'a\rb\n\r\n', 1)  # bare CRs count as line breaks too
+
+    def test_blank_lines(self):
+        self.assertSplitsLikeSplitlines(b'\n\na\n\n', 1)
+        self.assertSplitsLikeSplitlines(b'\n\na\n\n', 2, 3)
+
+    def test_out_of_range_lines(self):
+        data = b'a\nb\n'
+        self.assertEqual(split_line_range(data, 3), ([], 2))
+        self.assertEqual(split_line_range(data, 1, 5), ([b'a', b'b'], 2))
+        self.assertSplitsLikeSplitlines(data, 3)
+        self.assertSplitsLikeSplitlines(data, 5, 7)
+        self.assertSplitsLikeSplitlines(data, 2, 5)
+        self.assertSplitsLikeSplitlines(b'a\r\nb', 3, 4)
+
+
 class BlameTestCase(_RestfulGitTestCase):  # NOTE: This API is a RestfulGit extension
     def test_nonexistent_repo(self):
         resp = self.client.get('/repos/this-repo-does-not-exist/blame/master/README')
@@ -2480,6 +2675,33 @@ class RepoContentsTestCase(_RestfulGitTestCase):
         pass
 
 
+class QueryArgsTestCase(_RestfulGitTestCase):
+    def test_missing_int_arg_gives_default(self):
+        with self.app.test_request_context('/'):
+            self.assertEqual(get_int_arg('count', default=3, minimum=0), 3)
+            self.assertIsNone(get_int_arg('count'))
+
+    def test_int_arg_works(self):
+        with self.app.test_request_context('/?count=7'):
+            self.assertEqual(get_int_arg('count', default=3, minimum=0), 7)
+
+    def test_non_integer_int_arg_rejected(self):
+        with self.app.test_request_context('/?count=seven'):
+            with self.assertRaises(BadRequest) as context:
+                get_int_arg('count', default=3)
+        self.assertEqual(context.exception.description, "count was not a valid integer")
+
+    def test_int_arg_below_minimum_rejected(self):
+        with self.app.test_request_context('/?count=-1'):
+            with self.assertRaises(BadRequest) as context:
+                get_int_arg('count', minimum=0)
+        self.assertEqual(context.exception.description, "count must be at least 0")
+
+    def test_int_arg_at_minimum_accepted(self):
+        with self.app.test_request_context('/?count=0'):
+            self.assertEqual(get_int_arg('count', minimum=0), 0)
+
+
 class CompareTestCase(_RestfulGitTestCase):
     def test_works(self):
         resp = self.client.get('/repos/restfulgit/compare/{}...{}.diff'.format('initial', FIFTH_COMMIT))